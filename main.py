@@ -2,6 +2,8 @@ import argparse
 import asyncio
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from scraper import CONFIG
 from scraper.gold_pass import GoldPassTableHandler
 from scraper.troops import TroopTableHandler
 from scraper.players import PlayerTableHandler
@@ -42,6 +44,12 @@ async def main():
     logging.basicConfig(format='%(levelname)s - %(asctime)s - %(module)s.%(funcName)s Line %(lineno)d : %(message)s', 
                         level=get_log_level(args.verbosity))
 
+    # Blocking Azure Table Storage calls are run with asyncio.to_thread, so
+    # the default executor is sized for the concurrent scrapes rather than
+    # the number of CPUs.
+    executor_worker_count = CONFIG['StorageHandlerSettings']['DefaultExecutorWorkerCount']
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=executor_worker_count))
+
     login_kwargs = {
         'coc_email': args.email,
         'coc_password': args.password,
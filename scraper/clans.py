@@ -1,6 +1,5 @@
 import logging
 import coc
-import datetime
 
 from collections.abc import Iterator
 from scraper import CONFIG
@@ -8,6 +7,7 @@ from scraper.coc_client import CocClientHandler
 from scraper.players import PlayerTableHandler
 from scraper.storage import TableStorageHandler
 from scraper.utils import try_get_attr
+from scraper.utils import get_current_date_string
 from azure.data.tables import TableEntity
 
 LOGGER = logging.getLogger(__name__)
@@ -115,7 +115,7 @@ class ClanTableHandler(CocClientHandler):
             The row key for the clan in the current month.
         """
 
-        return datetime.datetime.now().strftime('%Y-%m-%d')
+        return get_current_date_string('%Y-%m-%d')
 
     def __does_clan_data_exist(self, clan_tag: str) -> bool:
         """
@@ -135,8 +135,7 @@ class ClanTableHandler(CocClientHandler):
         LOGGER.debug(f'Checking if entity exists in table {self.table_name}.')
         partition_key = self.__get_partition_key(clan_tag)
         row_key = self.__get_row_key()
-        entity = self.table_handler.try_get_entity(partition_key, row_key, select='PartitionKey', retries_remaining=self.table_handler.retry_entity_extraction_count)
-        return entity is not None
+        return self.table_handler.does_entity_exist(partition_key, row_key, retries_remaining=self.table_handler.retry_entity_extraction_count)
 
     async def __scrape_members_data(self, clan: coc.Clan) -> None:
         """
@@ -199,26 +198,29 @@ class ClanTableHandler(CocClientHandler):
             The entities to insert/upsert to the table.
         """
 
-        entity = TableEntity()
+        # The tag and location are looked up once and reused below.
+        tag = getattr(clan, 'tag', None)
+        location = getattr(clan, 'location', None)
+        entity = dict()
 
-        entity['PartitionKey'] = self.__get_partition_key(try_get_attr(clan, 'tag'))
+        entity['PartitionKey'] = self.__get_partition_key(tag)
         entity['RowKey'] = self.__get_row_key()
-        entity['Name'] = try_get_attr(clan, 'name')
-        entity['Tag'] = try_get_attr(clan, 'tag')
-        entity['Level'] = try_get_attr(clan, 'level')
-        entity['Type'] = try_get_attr(clan, 'type')
-        entity['Description'] = try_get_attr(clan, 'description')
-        entity['Location'] = try_get_attr(clan.location, 'id') if hasattr(clan, 'location') else None
-        entity['Points'] = try_get_attr(clan, 'points')
-        entity['VersusPoints'] = try_get_attr(clan, 'versus_points')
-        entity['RequiredTrophies'] = try_get_attr(clan, 'required_trophies')
-        entity['WarFrequency'] = try_get_attr(clan, 'war_frequency')
-        entity['WarWinStreak'] = try_get_attr(clan, 'war_win_streak')
-        entity['WarWins'] = try_get_attr(clan, 'war_wins')
-        entity['WarTies'] = try_get_attr(clan, 'war_ties')
-        entity['WarLosses'] = try_get_attr(clan, 'war_losses')
-        entity['IsWarLogPublic'] = try_get_attr(clan, 'is_war_log_public')
-        entity['MemberCount'] = try_get_attr(clan, 'member_count')
+        entity['Name'] = getattr(clan, 'name', None)
+        entity['Tag'] = tag
+        entity['Level'] = getattr(clan, 'level', None)
+        entity['Type'] = getattr(clan, 'type', None)
+        entity['Description'] = getattr(clan, 'description', None)
+        entity['Location'] = getattr(location, 'id', None) if location is not None else None
+        entity['Points'] = getattr(clan, 'points', None)
+        entity['VersusPoints'] = getattr(clan, 'versus_points', None)
+        entity['RequiredTrophies'] = getattr(clan, 'required_trophies', None)
+        entity['WarFrequency'] = getattr(clan, 'war_frequency', None)
+        entity['WarWinStreak'] = getattr(clan, 'war_win_streak', None)
+        entity['WarWins'] = getattr(clan, 'war_wins', None)
+        entity['WarTies'] = getattr(clan, 'war_ties', None)
+        entity['WarLosses'] = getattr(clan, 'war_losses', None)
+        entity['IsWarLogPublic'] = getattr(clan, 'is_war_log_public', None)
+        entity['MemberCount'] = getattr(clan, 'member_count', None)
 
         yield entity
 
@@ -260,19 +262,22 @@ class ClanTableHandler(CocClientHandler):
             await self.start_coc_client_session()
 
         for clan in clans:
+            clan_tag = try_get_attr(clan, 'tag')
+
             # Abandon scrape of clan if the clan data already exists.
-            should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_clan_data_exist(try_get_attr(clan, 'tag'))
+            should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_clan_data_exist(clan_tag)
             if should_abandon_scrape:
-                LOGGER.info(f'Abandoning clan scrape for the clan {try_get_attr(clan, "tag")} from location {try_get_attr(clan.location, "id") if hasattr(clan, "location") else None} because the clan data already exists.')
+                location = getattr(clan, 'location', None)
+                LOGGER.info(f'Abandoning clan scrape for the clan {clan_tag} from location {getattr(location, "id", None)} because the clan data already exists.')
                 continue
 
             try:
-                LOGGER.debug(f'Scraping clan {try_get_attr(clan, "tag")}.')
-                clan = await self.coc_client.get_clan(try_get_attr(clan, 'tag')) if not isinstance(clan, coc.Clan) else clan
+                LOGGER.debug(f'Scraping clan {clan_tag}.')
+                clan = await self.coc_client.get_clan(clan_tag) if not isinstance(clan, coc.Clan) else clan
                 self.__update_table(clan)
                 await self.__scrape_members_data_if_needed(clan)
             except Exception as ex:
-                LOGGER.error(f'Error while scraping clan {try_get_attr(clan, "tag")}: {ex}')
+                LOGGER.error(f'Error while scraping clan {clan_tag}: {ex}')
                 LOGGER.error(str(ex))
 
         if coc_client_handling:
@@ -1,6 +1,7 @@
 import logging
 import time
 import coc
+import aiohttp
 
 from scraper import CONFIG
 
@@ -17,6 +18,12 @@ class CocClientHandler(object):
     restart_sleep_time : int
         The number of seconds to sleep after closing the Clash of Clans API
         client session prior to a restart.
+    connection_limit_per_host : int
+        The maximum number of pooled connections to the Clash of Clans API.
+    dns_cache_ttl : int
+        The number of seconds resolved DNS entries are cached for.
+    keepalive_timeout : int
+        The number of seconds idle connections are kept open for reuse.
     coc_client : coc.Client
         The Clash of Clans API client object.
     
@@ -30,7 +37,11 @@ class CocClientHandler(object):
         Starts the Clash of Clans API client session.
     """
 
-    restart_sleep_time = CONFIG['CocClient']['RestartSleepTime']
+    configs = CONFIG['CocClient']
+    restart_sleep_time = configs['RestartSleepTime']
+    connection_limit_per_host = configs['ConnectionLimitPerHost']
+    dns_cache_ttl = configs['DnsCacheTtl']
+    keepalive_timeout = configs['KeepaliveTimeout']
 
     def __init__(
             self,
@@ -83,7 +94,15 @@ class CocClientHandler(object):
 
         try:
             LOGGER.debug('Starting Clash of Clans API client session.')
-            self.coc_client = coc.Client(load_game_data=coc.LoadGameData(default=True))
+            # The client keeps one HTTP session for its lifetime; the
+            # connector sizes its connection pool so that concurrent requests
+            # reuse open connections instead of paying new TLS handshakes.
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self.connection_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout)
+            self.coc_client = coc.Client(connector=connector, load_game_data=coc.LoadGameData(default=True))
             await self.coc_client.login(email=self.__coc_email, password=self.__coc_password)
         except Exception as ex:
             LOGGER.error('Failed to start Clash of Clans API client session.')
@@ -7,6 +7,7 @@ from scraper import CONFIG
 from scraper.coc_client import CocClientHandler
 from scraper.storage import TableStorageHandler
 from scraper.utils import try_get_attr
+from scraper.utils import get_current_date_string
 from azure.data.tables import TableEntity
 
 LOGGER = logging.getLogger(__name__)
@@ -72,8 +73,7 @@ class GoldPassTableHandler(CocClientHandler):
         LOGGER.debug(f'Checking if entity exists in table {self.table_name}.')
         partition_key = self.__get_partition_key()
         row_key = self.__get_row_key()
-        entity = self.table_handler.try_get_entity(partition_key, row_key, select='PartitionKey', retries_remaining=self.table_handler.retry_entity_extraction_count)
-        return entity is not None
+        return self.table_handler.does_entity_exist(partition_key, row_key, retries_remaining=self.table_handler.retry_entity_extraction_count)
 
     def __convert_timedelta_to_days(self, dt: datetime.timedelta) -> float:
         """
@@ -102,7 +102,7 @@ class GoldPassTableHandler(CocClientHandler):
             The partition key for the current month.
         """
 
-        return datetime.datetime.now().strftime('%Y')
+        return get_current_date_string('%Y')
 
     def __get_row_key(self) -> str:
         """
@@ -114,7 +114,7 @@ class GoldPassTableHandler(CocClientHandler):
             The row key for the current month.
         """
 
-        return datetime.datetime.now().strftime('%m')
+        return get_current_date_string('%m')
 
     def __convert_data_to_entity_list(self, data: coc.miscmodels.GoldPassSeason) -> Iterator[TableEntity]:
         """
@@ -136,10 +136,10 @@ class GoldPassTableHandler(CocClientHandler):
         end_time = try_get_attr(data, 'end_time', default=None)
         duration = try_get_attr(data, 'duration', default=None)
 
-        entity = TableEntity()
+        entity = dict()
         entity['PartitionKey'] = self.__get_partition_key()
         entity['RowKey'] = self.__get_row_key()
-        entity['SeasonId'] = datetime.datetime.now().strftime('%Y%m')
+        entity['SeasonId'] = get_current_date_string('%Y%m')
         entity['StartTime'] = start_time.time if start_time is not None else None
         entity['EndTime'] = end_time.time if end_time is not None else None
         entity['Duration'] = self.__convert_timedelta_to_days(duration) if duration is not None else None
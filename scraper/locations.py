@@ -8,11 +8,24 @@ from scraper.players import PlayerTableHandler
 from scraper.clans import ClanTableHandler
 from scraper.storage import TableStorageHandler
 from scraper.utils import try_get_attr
+from typing import TypedDict
 from collections.abc import Iterator
-from azure.data.tables import TableEntity
 
 LOGGER = logging.getLogger(__name__)
 
+class LocationEntity(TypedDict):
+    """
+    The entity written to the location table for a single location.
+    """
+
+    PartitionKey: str
+    RowKey: str
+    Id: int
+    Name: str
+    IsCountry: bool
+    CountryCode: str
+    LocalizedName: str
+
 class LocationTableHandler(CocClientHandler):
     """
     The table contains a single entity for each location. The entity's
@@ -30,6 +43,8 @@ class LocationTableHandler(CocClientHandler):
         The list of locations to scrape.
     scrape_enabled : bool
         Whether or not to scrape the locations.
+    scrape_from_all_locations_enabled : bool
+        Whether or not to scrape from all locations instead of `locations`.
     player_scrape_by_location_enabled : bool
         Whether or not to scrape the players in the locations.
     player_scrape_limit : int
@@ -86,6 +101,9 @@ class LocationTableHandler(CocClientHandler):
         self.table_handler = TableStorageHandler(table_name=self.table_name, **kwargs)
         self.__login_kwargs = kwargs
 
+        # The row key is constant for the whole run, so it is computed once.
+        self.__row_key = self.__get_row_key()
+
     def __get_row_key(self) -> str:
         """
         Gets the row key for the location.
@@ -110,15 +128,8 @@ class LocationTableHandler(CocClientHandler):
             True if the location data exists in the table, False otherwise.
         """
 
-        LOGGER.debug(f'Checking if location data with row key {self.__get_row_key()} exists in table {self.table_name}.')
-        
-        row_key = self.__get_row_key()
-
-        query_filter = f"RowKey eq '{row_key}'"
-        results = self.table_handler.try_query_entities(query_filter=query_filter, retries_remaining=self.table_handler.retry_entity_extraction_count, select='PartitionKey')
-        
-        has_results = bool(next(results, False))
-        return has_results
+        LOGGER.debug(f'Checking if location data with row key {self.__row_key} exists in table {self.table_name}.')
+        return self.table_handler.does_row_key_exist(self.__row_key, retries_remaining=self.table_handler.retry_entity_extraction_count)
 
     def __get_location_ids(self, locations: Iterator[coc.Location], only_country_ids: bool = True) -> Iterator[str]:
         """
@@ -144,7 +155,7 @@ class LocationTableHandler(CocClientHandler):
             LOGGER.debug(f"Getting location id {try_get_attr(location, 'id')}.")
             yield try_get_attr(location, 'id')
 
-    def __convert_data_to_entity_list__(self, locations: Iterator[coc.Location]) -> Iterator[TableEntity]:
+    def __convert_data_to_entity_list__(self, locations: Iterator[coc.Location]) -> Iterator[LocationEntity]:
         """
         Converts the location's data to a list of entities.
 
@@ -155,7 +166,7 @@ class LocationTableHandler(CocClientHandler):
 
         Yields
         ------
-        Dict[str,Union[float,int,str]]
+        LocationEntity
             The entity containing the location's data.
         """
 
@@ -166,14 +177,14 @@ class LocationTableHandler(CocClientHandler):
             # RowKey is currently set as year-month of scrape. This is to 
             # ensure that the IDs that represent the same location are
             # kept constant over time.
-            entity = dict()
-            entity['PartitionKey'] = f"{try_get_attr(location, 'id')}"
-            entity['RowKey'] = self.__get_row_key()
-            entity['Id'] = try_get_attr(location, 'id')
-            entity['Name'] = try_get_attr(location, 'name')
-            entity['IsCountry'] = try_get_attr(location, 'is_country')
-            entity['CountryCode'] = try_get_attr(location, 'country_code', default='')
-            entity['LocalizedName'] = try_get_attr(location, 'localized_name', default='')
+            entity = LocationEntity(
+                PartitionKey=f"{try_get_attr(location, 'id')}",
+                RowKey=self.__row_key,
+                Id=try_get_attr(location, 'id'),
+                Name=try_get_attr(location, 'name'),
+                IsCountry=try_get_attr(location, 'is_country'),
+                CountryCode=try_get_attr(location, 'country_code', default=''),
+                LocalizedName=try_get_attr(location, 'localized_name', default=''))
 
             LOGGER.info(entity)
             yield entity
@@ -193,26 +204,29 @@ class LocationTableHandler(CocClientHandler):
         None
         """
 
+        if not self.scrape_enabled:
+            LOGGER.info(f'Location table {self.table_name} is not updated because LocationSettings.ScrapeEnabled is {self.scrape_enabled}.')
+            return None
+
         should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_location_data_exist()
         if should_abandon_scrape:
-            LOGGER.info(f'Abandoning scrape for {self.table_name} table because location data with row key {self.__get_row_key()} already exists.')
+            LOGGER.info(f'Abandoning scrape for {self.table_name} table because location data with row key {self.__row_key} already exists.')
             return None
 
         if coc_client_handling:
             await self.start_coc_client_session()
 
-        if self.scrape_enabled:
-            try:
-                LOGGER.info("Scraping location data...")
-                
-                locations = await self.coc_client.search_locations(limit=None)
-                entities = self.__convert_data_to_entity_list__(locations)
-                self.table_handler.write_data_to_table(entities=entities)
-                    
-                LOGGER.info("Location data scraped successfully.")
-            except Exception as ex:
-                LOGGER.error("Error occurred while scraping location data.")
-                LOGGER.error(str(ex))
+        try:
+            LOGGER.info("Scraping location data...")
+
+            locations = await self.coc_client.search_locations(limit=None)
+            entities = self.__convert_data_to_entity_list__(locations)
+            self.table_handler.write_data_to_table(entities=entities)
+
+            LOGGER.info("Location data scraped successfully.")
+        except Exception as ex:
+            LOGGER.error("Error occurred while scraping location data.")
+            LOGGER.error(str(ex))
 
         if coc_client_handling:
             await self.close_coc_client_session()
@@ -232,31 +246,34 @@ class LocationTableHandler(CocClientHandler):
         None
         """
 
+        if not self.clan_scrape_by_location_enabled:
+            LOGGER.info(f'Clans are not scraped by location because LocationSettings.ClanScrapeByLocationEnabled is {self.clan_scrape_by_location_enabled}.')
+            return None
+
         if coc_client_handling:
             await self.start_coc_client_session()
 
-        if self.clan_scrape_by_location_enabled:
-            try:
-                if self.scrape_from_all_locations_enabled:
-                    LOGGER.info("Scraping clans from all locations.")
-                    locations = await self.coc_client.search_locations(limit=None)
-                    location_ids = self.__get_location_ids(locations, only_country_ids=False)
-                else:
-                    LOGGER.info("Scraping clans from specified locations.")
-                    location_ids = self.locations
-
-                LOGGER.debug("Scraping clans by location.")
-                for location in location_ids:
-                    LOGGER.info(f"Scraping {self.clan_scrape_limit} clans in {location}.")
-                    clans = await self.coc_client.get_location_clans(location_id=location, limit=self.clan_scrape_limit)
-
-                    coc_email = self.__login_kwargs.get('coc_email')
-                    coc_password = self.__login_kwargs.get('coc_password')
-                    writer = ClanTableHandler(coc_email=coc_email, coc_password=coc_password, coc_client=self.coc_client, **self.__login_kwargs)
-                    await writer.scrape_location_clans(clans, coc_client_handling=False)
-            except Exception as ex:
-                LOGGER.error("Error occurred while scraping clans by location.")
-                LOGGER.error(str(ex))
+        try:
+            if self.scrape_from_all_locations_enabled:
+                LOGGER.info("Scraping clans from all locations.")
+                locations = await self.coc_client.search_locations(limit=None)
+                location_ids = self.__get_location_ids(locations, only_country_ids=False)
+            else:
+                LOGGER.info("Scraping clans from specified locations.")
+                location_ids = self.locations
+
+            LOGGER.debug("Scraping clans by location.")
+            for location in location_ids:
+                LOGGER.info(f"Scraping {self.clan_scrape_limit} clans in {location}.")
+                clans = await self.coc_client.get_location_clans(location_id=location, limit=self.clan_scrape_limit)
+
+                coc_email = self.__login_kwargs.get('coc_email')
+                coc_password = self.__login_kwargs.get('coc_password')
+                writer = ClanTableHandler(coc_email=coc_email, coc_password=coc_password, coc_client=self.coc_client, **self.__login_kwargs)
+                await writer.scrape_location_clans(clans, coc_client_handling=False)
+        except Exception as ex:
+            LOGGER.error("Error occurred while scraping clans by location.")
+            LOGGER.error(str(ex))
 
         if coc_client_handling:
             await self.close_coc_client_session()
@@ -276,31 +293,34 @@ class LocationTableHandler(CocClientHandler):
         None
         """
 
+        if not self.player_scrape_by_location_enabled:
+            LOGGER.info(f'Players are not scraped by location because LocationSettings.PlayerScrapeByLocationEnabled is {self.player_scrape_by_location_enabled}.')
+            return None
+
         if coc_client_handling:
             await self.start_coc_client_session()
 
-        if self.player_scrape_by_location_enabled:
-            try:
-                if self.scrape_from_all_locations_enabled:
-                    LOGGER.info("Scraping players from all locations.")
-                    locations = await self.coc_client.search_locations(limit=None)
-                    location_ids = self.__get_location_ids(locations, only_country_ids=True)
-                else:
-                    LOGGER.info("Scraping players from specified locations.")
-                    location_ids = self.locations
-
-                LOGGER.info("Scraping players by location.")
-                for location in location_ids:
-                    LOGGER.info(f"Scraping {self.player_scrape_limit} players in {location}.")
-                    players = await self.coc_client.get_location_players(location_id=location, limit=self.player_scrape_limit)
-
-                    coc_email = self.__login_kwargs.get('coc_email')
-                    coc_password = self.__login_kwargs.get('coc_password')
-                    writer = PlayerTableHandler(coc_email=coc_email, coc_password=coc_password, coc_client=self.coc_client, **self.__login_kwargs)
-                    await writer.scrape_location_players(players, coc_client_handling=False)
-            except Exception as ex:
-                LOGGER.error("Error occurred while scraping players by location.")
-                LOGGER.error(str(ex))
+        try:
+            if self.scrape_from_all_locations_enabled:
+                LOGGER.info("Scraping players from all locations.")
+                locations = await self.coc_client.search_locations(limit=None)
+                location_ids = self.__get_location_ids(locations, only_country_ids=True)
+            else:
+                LOGGER.info("Scraping players from specified locations.")
+                location_ids = self.locations
+
+            LOGGER.info("Scraping players by location.")
+            for location in location_ids:
+                LOGGER.info(f"Scraping {self.player_scrape_limit} players in {location}.")
+                players = await self.coc_client.get_location_players(location_id=location, limit=self.player_scrape_limit)
+
+                coc_email = self.__login_kwargs.get('coc_email')
+                coc_password = self.__login_kwargs.get('coc_password')
+                writer = PlayerTableHandler(coc_email=coc_email, coc_password=coc_password, coc_client=self.coc_client, **self.__login_kwargs)
+                await writer.scrape_location_players(players, coc_client_handling=False)
+        except Exception as ex:
+            LOGGER.error("Error occurred while scraping players by location.")
+            LOGGER.error(str(ex))
 
         if coc_client_handling:
             await self.close_coc_client_session()
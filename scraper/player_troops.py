@@ -1,19 +1,36 @@
 import logging
+import itertools
+import threading
 import coc
-import datetime
 
 from typing import Union
 from collections.abc import Iterator
 from scraper import CONFIG
 from scraper.storage import TableStorageHandler
 from scraper.utils import try_get_attr
-from azure.data.tables import TableEntity
+from scraper.utils import get_current_date_string
 
 LOGGER = logging.getLogger(__name__)
 
+# Optional troop attributes that are defined by the troop's class rather
+# than computed per troop, so whether a troop has them is probed once per
+# class and cached here. Computed properties, such as is_max_for_townhall,
+# are read per troop instead.
+OPTIONAL_TROOP_ATTRIBUTES = ('get_max_level_for_townhall', 'is_super_troop')
+TROOP_CAPABILITIES = dict()
+TROOP_CAPABILITIES_LOCK = threading.Lock()
+
 class PlayerTroopsTableHandler(object):
     """
-    This table contains a player's current troop progress in the game.
+    This table contains a player's current troop progress in the game. The
+    entity's PartitionKey is the player tag and the RowKey is the scrape
+    date followed by the troop id, so all of a player's troops share one
+    partition.
+
+    This layout is written to its own table, see
+    PlayerTroopsSettings.TableName. The previous "PlayerTroop" table, keyed
+    by player tag and troop id with the scrape date as RowKey, is kept as
+    is and no longer written to.
 
     Attributes
     ----------
@@ -24,11 +41,12 @@ class PlayerTroopsTableHandler(object):
     abandon_scrape_if_entity_exists : bool
         Determines if the scrape should be abandoned if the entity exists in
         the table.
-    validation_troop_id : str
-        The troop id to use for validation if `abandon_scrape_if_entity_exists` is True.
 
     Methods
     -------
+    preload_existing_data(player_tags: collections.abc.Iterable[str], date: str = None) -> None
+        Pins the scrape date and looks up which players already have troop
+        data in the table.
     process_table(data: coc.abc.BasePlayer) -> None
         Processes the player's troop data and adds it to the table.
     """
@@ -37,7 +55,6 @@ class PlayerTroopsTableHandler(object):
     table_name = configs['TableName']
     scrape_enabled = configs['ScrapeEnabled']
     abandon_scrape_if_entity_exists = configs['AbandonScrapeIfEntityExists']
-    validation_troop_id = configs['ValidationTroopId']
 
     def __init__(self, **kwargs) -> None:
         """
@@ -48,8 +65,50 @@ class PlayerTroopsTableHandler(object):
         """
 
         self.table_handler = TableStorageHandler(table_name=self.table_name, **kwargs)
+        # Partition keys of players known to have troop data for today, or
+        # None if they have not been preloaded.
+        self.__existing_partition_keys = None
+        # The date of the current scrape, pinned when the scrape starts.
+        self.__date = None
+
+    def preload_existing_data(self, player_tags: Iterator[str], date: str = None) -> None:
+        """
+        Starts a scrape by pinning its date, then, if scrapes are abandoned
+        for existing data, looks up which of the given players already have
+        troop data in the table for that date, so that later existence
+        checks are answered from memory instead of one query per player. If
+        the lookup fails, the existence checks fall back to one query per
+        player.
+
+        Parameters
+        ----------
+        player_tags : collections.abc.Iterable[str]
+            The player tags that are about to be scraped.
+        date : str, optional
+            (Default: None) The date of the scrape, so that the troop rows
+            share the date of the player rows. If not given, the current
+            date is used.
+
+        Returns
+        -------
+        None
+        """
+
+        self.__date = date if date is not None else get_current_date_string('%Y-%m-%d')
+        self.__existing_partition_keys = None
+        if not self.abandon_scrape_if_entity_exists:
+            return None
 
-    def __does_player_troop_data_exist(self, player_tag: str, troop_id: str = validation_troop_id) -> bool:
+        date = self.__date
+        partition_keys = (self.__get_partition_key(player_tag=player_tag) for player_tag in player_tags)
+        try:
+            self.__existing_partition_keys = self.table_handler.try_query_existing_partition_keys(partition_keys, query_filter=f"RowKey ge '{date}-' and RowKey lt '{date}.'")
+        except Exception as ex:
+            LOGGER.error('Unable to preload existing data from table %s, checking players one by one.', self.table_name)
+            LOGGER.error(str(ex))
+            self.__existing_partition_keys = None
+
+    def __does_player_troop_data_exist(self, player_tag: str) -> bool:
         """
         Checks if the player's troop data exists in the table.
 
@@ -57,9 +116,6 @@ class PlayerTroopsTableHandler(object):
         ----------
         player_tag : str
             The player tag to check if data exists for.
-        troop_id : str, optional
-            (Default: self.validation_troop_id) The troop id to check if 
-            data exists for.
         
         Returns
         -------
@@ -67,121 +123,174 @@ class PlayerTroopsTableHandler(object):
             True if the player troop data exists in the table, False otherwise.
         """
 
-        LOGGER.debug(f'Checking if troop {troop_id} of {player_tag} exists in table {self.table_name}.')
+        LOGGER.debug('Checking if troop data of %s exists in table %s.', player_tag, self.table_name)
+
+        partition_key = self.__get_partition_key(player_tag=player_tag)
+        if self.__existing_partition_keys is not None:
+            return partition_key in self.__existing_partition_keys
         
-        # To speed up the checking process, we assume that every player that we
-        # want to scrape has at least unlocked a single troop (troop_id: 4000000),
-        # which is the 1st troop to be unlocked in the game. 
-        partition_key = self.__get_partition_key(player_tag=player_tag, troop_id=troop_id)
-        row_key = self.__get_row_key()
+        # All of a player's troops for the day share the partition key and a
+        # row key prefix, so a single range query on that partition is enough.
+        date = self.__get_date()
 
-        entity = self.table_handler.try_get_entity(partition_key=partition_key, row_key=row_key, select='PartitionKey', retries_remaining=self.table_handler.retry_entity_extraction_count)
-        return entity is not None
+        query_filter = f"PartitionKey eq '{partition_key}' and RowKey ge '{date}-' and RowKey lt '{date}.'"
+        results = self.table_handler.try_query_entities(query_filter=query_filter, retries_remaining=self.table_handler.retry_entity_extraction_count, select='PartitionKey', results_per_page=1)
 
-    def __is_super_troop_active(self, troop: coc.abc.DataContainer, data: coc.abc.BasePlayer) -> bool:
+        has_results = results is not None and bool(next(iter(results), False))
+        return has_results
+
+    def __get_partition_key(self, player_tag: str) -> str:
         """
-        Checks if a super troop is active for the player.
-        
+        Gets the partition key for the player's troop data, i.e. the player
+        tag. All of a player's troops share the same partition.
+
         Parameters
         ----------
-        troop : coc.abc.DataContainer
-            The troop to check.
-        data : coc.abc.BasePlayer
-            The player data to check.
+        player_tag : str
+            The player tag to get the partition key for.
 
         Returns
         -------
-        bool
-            Whether the super troop is active or not.
+        str
+            The partition key for the player's troop data.
         """
 
-        return try_get_attr(data, 'is_super_troop', default=False) and troop in data.home_troops
+        return player_tag.lstrip("#")
 
-    def __get_partition_key(self, player_tag: str, troop_id: str) -> str:
+    def __get_date(self) -> str:
         """
-        Gets the partition key for the player's troop data.
-
-        Parameters
-        ----------
-        player_tag : str
-            The player tag to get the partition key for.
-        troop_id : str
-            The troop id to get the partition key for.
+        Gets the date used as the row key prefix, i.e. the date the current
+        scrape started on. The date is computed once per scrape so that a
+        run crossing midnight writes and checks a single date.
 
         Returns
         -------
         str
-            The partition key for the player's troop data.
+            The date of the current scrape.
         """
 
-        return f'{player_tag.lstrip("#")}-{troop_id}'
+        if self.__date is None:
+            self.__date = get_current_date_string('%Y-%m-%d')
+        return self.__date
 
-    def __get_row_key(self) -> str:
+    def __get_row_key(self, date: str, troop_id: str) -> str:
         """
         Gets the row key for the player's troop data.
 
+        Parameters
+        ----------
+        date : str
+            The date of the scrape, as returned by `__get_date`.
+        troop_id : str
+            The troop id to get the row key for.
+
         Returns
         -------
         str
             The row key for the player's troop data.
         """
 
-        return datetime.datetime.now().strftime('%Y-%m-%d')
+        return f'{date}-{troop_id}'
+
+    def __get_troop_capabilities(self, troop: coc.abc.DataContainer) -> tuple[bool, ...]:
+        """
+        Gets which of the optional troop attributes the troop has. The
+        result is cached by the troop's class, so missing attributes do not
+        raise and catch an AttributeError on every troop.
+
+        Parameters
+        ----------
+        troop : coc.abc.DataContainer
+            The troop to check.
 
-    def __get_troop_list(self, data: coc.abc.BasePlayer) -> list[Union[coc.Hero, coc.Troop, coc.Spell]]:
+        Returns
+        -------
+        tuple[bool, ...]
+            Whether the troop has each of the `OPTIONAL_TROOP_ATTRIBUTES`.
         """
-        Gets the list of troops for the player.
+
+        capabilities = TROOP_CAPABILITIES.get(type(troop))
+        if capabilities is None:
+            # Troops are converted from several worker threads.
+            with TROOP_CAPABILITIES_LOCK:
+                capabilities = TROOP_CAPABILITIES.get(type(troop))
+                if capabilities is None:
+                    capabilities = tuple(hasattr(troop, attribute) for attribute in OPTIONAL_TROOP_ATTRIBUTES)
+                    TROOP_CAPABILITIES[type(troop)] = capabilities
+        return capabilities
+
+    def __get_troop_list(self, data: coc.abc.BasePlayer, home_troop_ids: set[int]) -> list[Union[coc.Hero, coc.Troop, coc.Spell]]:
+        """
+        Gets the list of troops for the player. Troops that are None or
+        have no id or level are left out.
 
         Parameters
         ----------
         data : coc.abc.BasePlayer
             The player data to get the troops for.
+        home_troop_ids : set[int]
+            The ids of the player's home troops, which include the active
+            super troops.
 
         Returns
         -------
         list[Union[coc.Hero, coc.Troop, coc.Spell]]
-            The list of troops for the player.
+            The list of valid troops for the player.
         """
 
-        inactive_super_troops = list(set(data.super_troops) - set(data.home_troops))
-        return data.heroes + data.hero_pets + data.spells + data.home_troops + data.builder_troops + inactive_super_troops
-        
+        # The troop lists are chained rather than concatenated, so the only
+        # list built is the filtered one.
+        inactive_super_troops = (troop for troop in data.super_troops if troop.id not in home_troop_ids)
+        troops = itertools.chain(data.heroes, data.hero_pets, data.spells, data.home_troops, data.builder_troops, inactive_super_troops)
+        valid_troops = [troop for troop in troops if troop is not None and troop.id is not None and troop.level is not None]
 
-    def __convert_data_to_entity_list(self, data: coc.abc.BasePlayer) -> Iterator[TableEntity]:
+        LOGGER.debug('Kept %s troops of %s, skipping those that are either (1) None, (2) have None id, or (3) have None level.', len(valid_troops), data.tag)
+        return valid_troops
+
+    def __convert_data_to_entity_list(self, data: coc.abc.BasePlayer) -> list[dict]:
         """
-        Converts the player's troop data to a list of table entities.
+        Converts the player's troop data to a list of table entities. The
+        entities are plain dicts, which the Azure SDK accepts as is.
 
         Parameters
         ----------
         data : coc.abc.BasePlayer
             The player data to convert to table entities.
         
-        Yields
-        ------
-        TableEntity
+        Returns
+        -------
+        list[dict]
             The list of table entities.
         """
 
-        troop_list = self.__get_troop_list(data=data)
+        # Player-level values are the same for every troop, so they are
+        # looked up once instead of once per troop. The home troop ids are
+        # shared by the inactive super troop filter and the activity check.
+        # The row key method is bound to a local as well.
+        date = self.__get_date()
+        partition_key = self.__get_partition_key(player_tag=data.tag)
+        town_hall = data.town_hall
+        home_troop_ids = {troop.id for troop in data.home_troops}
+        get_row_key = self.__get_row_key
+
+        entities = []
+        troop_list = self.__get_troop_list(data=data, home_troop_ids=home_troop_ids)
         for troop in troop_list:
-            # Skip troop if troop object is None or its Id and Level is None
-            if (troop is None or \
-                try_get_attr(troop, 'id') is None or \
-                try_get_attr(troop, 'level') is None):
-                LOGGER.debug(f'Skipping {troop} as it is either (1) None, (2) has None id, or (3) has None level.')
-                continue
-
-            entity = TableEntity()
-            entity['PartitionKey'] = self.__get_partition_key(player_tag=try_get_attr(data, 'tag'), troop_id=try_get_attr(troop, 'id'))
-            entity['RowKey'] = self.__get_row_key()
-            entity['TroopId'] = try_get_attr(troop, 'id')
-            entity['TroopLevel'] = try_get_attr(troop, 'level')
-            entity['TroopVillage'] = try_get_attr(troop, 'village')
-            entity['TroopTownhallMaxLevel'] = troop.get_max_level_for_townhall(data.town_hall) if hasattr(troop, 'get_max_level_for_townhall') else None
-            entity['TroopIsMaxForTownhall'] = try_get_attr(troop, 'is_max_for_townhall')
-            entity['TroopIsActive'] = self.__is_super_troop_active(troop, data) if try_get_attr(data, 'is_super_troop') is not None else None
-            
-            yield entity
+            has_max_level, has_is_super_troop = self.__get_troop_capabilities(troop)
+            is_super_troop = getattr(troop, 'is_super_troop', None) if has_is_super_troop else None
+            entities.append({
+                'PartitionKey': partition_key,
+                'RowKey': get_row_key(date=date, troop_id=troop.id),
+                'TroopId': troop.id,
+                'TroopLevel': troop.level,
+                'TroopVillage': getattr(troop, 'village', None),
+                'TroopTownhallMaxLevel': troop.get_max_level_for_townhall(town_hall) if has_max_level else None,
+                'TroopIsMaxForTownhall': getattr(troop, 'is_max_for_townhall', None),
+                # An active super troop is listed among the home troops.
+                'TroopIsActive': (is_super_troop and troop.id in home_troop_ids) if is_super_troop is not None else None,
+            })
+
+        return entities
 
     def process_table(self, data: coc.abc.BasePlayer) -> None:
         """
@@ -193,9 +302,10 @@ class PlayerTroopsTableHandler(object):
             The player data to process.
         """
 
-        should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_player_troop_data_exist(player_tag=try_get_attr(data, 'tag'))
+        player_tag = try_get_attr(data, 'tag')
+        should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_player_troop_data_exist(player_tag=player_tag)
         if should_abandon_scrape:
-            LOGGER.info(f'Abandoning scrape for {try_get_attr(data, "tag")} as data already exists in table {self.table_name}.')
+            LOGGER.info('Abandoning scrape for %s as data already exists in table %s.', player_tag, self.table_name)
             return None
 
         entities = self.__convert_data_to_entity_list(data=data)
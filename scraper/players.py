@@ -1,6 +1,9 @@
 import logging
+import asyncio
+import time
 import coc
-import datetime
+import operator
+import random
 
 from collections.abc import Iterator
 from scraper import CONFIG
@@ -8,10 +11,44 @@ from scraper.player_troops import PlayerTroopsTableHandler
 from scraper.storage import TableStorageHandler
 from scraper.coc_client import CocClientHandler
 from scraper.utils import try_get_attr
-from azure.data.tables import TableEntity
+from scraper.utils import get_current_date_string
 
 LOGGER = logging.getLogger(__name__)
 
+# Clash of Clans API response statuses worth retrying a request for.
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Entity keys and the player attributes they are read from.
+BASE_DETAILS = (
+    ('Name', 'name'),
+
+    # Clan-level details
+    ('Role', 'role'),
+    ('ClanRank', 'clan_rank'),
+    ('ClanPreviousRank', 'clan_previous_rank'),
+    ('Donations', 'donations'),
+    ('Received', 'received'),
+
+    # Player-level details
+    ('ExpLevel', 'exp_level'),
+    ('LeagueId', 'league_id'),
+    ('Trophies', 'trophies'),
+    ('VersusTrophies', 'versus_trophies'),
+    ('ClanCapitalContributions', 'clan_capital_contributions'),
+    ('AttackWins', 'attack_wins'),
+    ('DefenseWins', 'defense_wins'),
+    ('VersusAttackWins', 'versus_attack_wins'),
+    ('BestTrophies', 'best_trophies'),
+    ('BestVersusTrophies', 'best_versus_trophies'),
+    ('WarStars', 'war_stars'),
+    ('WarOptedIn', 'war_opted_in'),
+    ('TownHall', 'town_hall'),
+    ('TownHallWeapon', 'town_hall_weapon'),
+    ('BuilderHall', 'builder_hall'),
+)
+BASE_DETAIL_KEYS = tuple(key for key, _ in BASE_DETAILS)
+BASE_DETAILS_GETTER = operator.attrgetter(*(attribute for _, attribute in BASE_DETAILS))
+
 class PlayerTableHandler(CocClientHandler):
     """
     The table contains a player's current progress in the game. Currently, 
@@ -30,6 +67,26 @@ class PlayerTableHandler(CocClientHandler):
     abandon_scrape_if_entity_exists : bool
         Determines if the scrape should be abandoned if the entity exists in
         the table.
+    max_concurrency : int
+        The number of workers fetching player data from the Clash of Clans
+        API concurrently.
+    write_concurrency : int
+        The number of workers writing player data to the tables
+        concurrently.
+    pipeline_queue_size : int
+        The maximum number of fetched players waiting to be written.
+    unknown_player_ttl : int
+        The number of seconds a player tag that was not found by the Clash
+        of Clans API is skipped for.
+    fetch_retry_count : int
+        The number of times a player fetch is retried after a transient
+        Clash of Clans API error.
+    fetch_retry_base_delay : float
+        The base number of seconds of the exponential backoff between
+        fetch retries.
+    unknown_players : dict[str, float]
+        Shared across all handlers, maps player tags that were not found by
+        the Clash of Clans API to the time until which they are skipped.
 
     Methods
     -------
@@ -46,6 +103,13 @@ class PlayerTableHandler(CocClientHandler):
     players = configs['Players']
     scrape_enabled = configs['ScrapeEnabled']
     abandon_scrape_if_entity_exists = configs['AbandonScrapeIfEntityExists']
+    max_concurrency = configs['MaxConcurrency']
+    write_concurrency = configs['WriteConcurrency']
+    pipeline_queue_size = configs['PipelineQueueSize']
+    unknown_player_ttl = configs['UnknownPlayerTtl']
+    fetch_retry_count = configs['FetchRetryCount']
+    fetch_retry_base_delay = configs['FetchRetryBaseDelay']
+    unknown_players = dict()
 
     def __init__(
             self, 
@@ -67,83 +131,92 @@ class PlayerTableHandler(CocClientHandler):
         """
 
         super().__init__(coc_email=coc_email, coc_password=coc_password, coc_client=coc_client)
+
         self.troop_handler = PlayerTroopsTableHandler(**kwargs)
         self.table_handler = TableStorageHandler(table_name=self.table_name, **kwargs)
+        # Partition keys of players known to have data for today, or None if
+        # they have not been preloaded.
+        self.__existing_partition_keys = None
+        # The row key of the current scrape, pinned when the scrape starts.
+        self.__row_key = None
 
-    def __convert_data_to_entity_list(self, data: coc.abc.BasePlayer) -> Iterator[TableEntity]:
+    def __convert_data_to_entity_list(self, data: coc.abc.BasePlayer) -> list[dict]:
         """
-        Converts the data to a list of entities.
+        Converts the data to a list of entities. The entities are plain
+        dicts, which the Azure SDK accepts as is.
 
         Parameters
         ----------
         data : coc.abc.BasePlayer
             The player data to add to the entity.
 
-        Yields
-        ------
-        TableEntity
+        Returns
+        -------
+        list[dict]
             The entity corresponding to the input player and their base
             information.
         """
 
-        entity = TableEntity()
-
-        # Mandatory keys
-        entity['PartitionKey'] = self.__get_partition_key(player=try_get_attr(data, 'tag'))
-        entity['RowKey'] = self.__get_row_key()
-
-        # Identity keys
-        entity['SeasonId'] = datetime.datetime.now().strftime('%Y-%m')
-        entity['Tag'] = try_get_attr(data, 'tag')
-        entity['Name'] = try_get_attr(data, 'name')
-
-        # Clan-level details
-        entity['Clan'] = try_get_attr(data.clan, 'tag') if try_get_attr(data, 'clan') is not None else None
-        entity['Role'] = try_get_attr(data, 'role')
-        entity['ClanRank'] = try_get_attr(data, 'clan_rank')
-        entity['ClanPreviousRank'] = try_get_attr(data, 'clan_previous_rank')
-        entity['Donations'] = try_get_attr(data, 'donations')
-        entity['Received'] = try_get_attr(data, 'received')
-
-        # Player-level details
-        entity['ExpLevel'] = try_get_attr(data, 'exp_level')
-        entity['LeagueId'] = try_get_attr(data, 'league_id')
-        entity['Trophies'] = try_get_attr(data, 'trophies')
-        entity['VersusTrophies'] = try_get_attr(data, 'versus_trophies')
-        entity['ClanCapitalContributions'] = try_get_attr(data, 'clan_capital_contributions')
-        entity['AttackWins'] = try_get_attr(data, 'attack_wins')
-        entity['DefenseWins'] = try_get_attr(data, 'defense_wins')
-        entity['VersusAttackWins'] = try_get_attr(data, 'versus_attack_wins')
-        entity['BestTrophies'] = try_get_attr(data, 'best_trophies')
-        entity['BestVersusTrophies'] = try_get_attr(data, 'best_versus_trophies')
-        entity['WarStars'] = try_get_attr(data, 'war_stars')
-        entity['WarOptedIn'] = try_get_attr(data, 'war_opted_in')
-        entity['TownHall'] = try_get_attr(data, 'town_hall')
-        entity['TownHallWeapon'] = try_get_attr(data, 'town_hall_weapon')
-        entity['BuilderHall'] = try_get_attr(data, 'builder_hall')
-
-        yield entity
-
-    async def __get_data(self, player: str) -> Iterator[TableEntity]:
+        row_key = self.__get_row_key()
+        tag = data.tag
+        clan = getattr(data, 'clan', None)
+        entity = {
+            # Mandatory keys
+            'PartitionKey': self.__get_partition_key(player=tag),
+            'RowKey': row_key,
+
+            # Identity keys
+            'SeasonId': row_key[:7],
+            'Tag': tag,
+
+            # Clan-level details
+            'Clan': getattr(clan, 'tag', None) if clan is not None else None,
+        }
+
+        # The remaining details are read with a single attrgetter call. If
+        # the player object lacks any of them, they are read one by one.
+        try:
+            values = BASE_DETAILS_GETTER(data)
+        except AttributeError:
+            values = tuple(getattr(data, attribute, None) for _, attribute in BASE_DETAILS)
+        entity.update(zip(BASE_DETAIL_KEYS, values))
+
+        return [entity]
+
+    async def __write_data(self, data: coc.abc.BasePlayer) -> None:
         """
-        Gets the data from the API and converts to an enumerator of entities
-        to be written to the table.
+        Writes the player's base information to the table.
 
         Parameters
         ----------
-        player : str
-            The player tag to get data for.
-        
+        data : coc.abc.BasePlayer
+            The player data to write.
+
         Returns
         -------
-        collections.abc.Iterator[azure.core.tables.TableEntity]
-            All the entities corresponding to the input player.
+        None
         """
 
-        data = await self.coc_client.get_player(player_tag=player)
-        self.troop_handler.process_table(data)
+        # The Azure Table Storage client is synchronous, so its calls run in
+        # worker threads to keep the event loop free for other players.
+        entities = self.__convert_data_to_entity_list(data)
+        await asyncio.to_thread(self.table_handler.write_data_to_table, entities=entities)
 
-        return self.__convert_data_to_entity_list(data)
+    async def __write_troop_data(self, data: coc.abc.BasePlayer) -> None:
+        """
+        Writes the player's troop data to the player troop table.
+
+        Parameters
+        ----------
+        data : coc.abc.BasePlayer
+            The player data to write.
+
+        Returns
+        -------
+        None
+        """
+
+        await asyncio.to_thread(self.troop_handler.process_table, data)
 
     def __get_partition_key(self, player: str) -> str:
         """
@@ -165,15 +238,19 @@ class PlayerTableHandler(CocClientHandler):
 
     def __get_row_key(self) -> str:
         """
-        Gets the row key for the player.
+        Gets the row key for the player, i.e. the date the current scrape
+        started on. The row key is computed once per scrape so that a run
+        crossing midnight writes and checks a single date.
 
         Returns
         -------
         str
-            The row key for the player in the current month.
+            The row key for the player in the current day.
         """
 
-        return datetime.datetime.now().strftime('%Y-%m-%d')
+        if self.__row_key is None:
+            self.__row_key = get_current_date_string('%Y-%m-%d')
+        return self.__row_key
 
     def __does_player_data_exist(self, player: str) -> bool:
         """
@@ -190,35 +267,214 @@ class PlayerTableHandler(CocClientHandler):
             True if the player data exists in the table, False otherwise.
         """
 
-        LOGGER.debug(f'Checking if {player} exists in table {self.table_name}.')
+        LOGGER.debug('Checking if %s exists in table %s.', player, self.table_name)
         
         partition_key = self.__get_partition_key(player=player)
         row_key = self.__get_row_key()
+        if self.__existing_partition_keys is not None:
+            return partition_key in self.__existing_partition_keys
 
-        entity = self.table_handler.try_get_entity(partition_key, row_key, select='PartitionKey', retries_remaining=self.table_handler.retry_entity_extraction_count)
-        return entity is not None
+        return self.table_handler.does_entity_exist(partition_key, row_key, retries_remaining=self.table_handler.retry_entity_extraction_count)
 
-    async def __update_table(self, player: str) -> None:
+    def __preload_existing_data(self, players: list[str]) -> None:
         """
-        Updates the table with the input player's data.
+        Pins the date of the scrape and looks up which of the input players
+        already have player and troop data in the tables for it, so that
+        the existence checks during the scrape are answered from memory. If
+        a lookup fails, the existence checks fall back to one lookup per
+        player.
 
         Parameters
         ----------
-        player : str
-            The player tag to update the table with.
+        players : list[str]
+            The player tags that are about to be scraped.
 
         Returns
         -------
         None
         """
 
-        should_abandon_scrape = self.abandon_scrape_if_entity_exists and self.__does_player_data_exist(player)
-        if should_abandon_scrape:
-            LOGGER.info(f'Abandoning scrape for {player} because it already exists.')
+        row_key = self.__get_row_key()
+        if self.abandon_scrape_if_entity_exists:
+            LOGGER.debug('Preloading existing data for %s players from table %s.', len(players), self.table_name)
+            partition_keys = [self.__get_partition_key(player=player) for player in players]
+            try:
+                self.__existing_partition_keys = self.table_handler.try_query_existing_partition_keys(partition_keys, query_filter=f"RowKey eq '{row_key}'")
+            except Exception as ex:
+                LOGGER.error('Unable to preload existing data from table %s, checking players one by one.', self.table_name)
+                LOGGER.error(str(ex))
+                self.__existing_partition_keys = None
+
+        # The troop rows are written under the same date as the player rows.
+        self.troop_handler.preload_existing_data(players, date=row_key)
+
+    def __is_unknown_player(self, player: str) -> bool:
+        """
+        Checks if the player tag was recently not found by the Clash of Clans
+        API, in which case scraping it again would fail the same way.
+
+        Parameters
+        ----------
+        player : str
+            The player tag to check.
+
+        Returns
+        -------
+        bool
+            True if the player tag should be skipped, False otherwise.
+        """
+
+        expiry = PlayerTableHandler.unknown_players.get(player)
+        if expiry is None:
+            return False
+
+        if expiry < time.monotonic():
+            del PlayerTableHandler.unknown_players[player]
+            return False
+
+        return True
+
+    async def __get_player_with_retry(self, player: str) -> coc.abc.BasePlayer:
+        """
+        Gets the player's data from the API, retrying with exponential
+        backoff and full jitter when the API responds with a transient
+        error. A `Retry-After` header sent with the error is honored.
+
+        Parameters
+        ----------
+        player : str
+            The player tag to get data for.
+
+        Returns
+        -------
+        coc.abc.BasePlayer
+            The player data.
+        """
+
+        for attempt in range(self.fetch_retry_count + 1):
+            try:
+                return await self.coc_client.get_player(player_tag=player)
+            except coc.HTTPException as ex:
+                if ex.status not in RETRYABLE_STATUSES or attempt == self.fetch_retry_count:
+                    raise
+
+                delay = random.uniform(0, self.fetch_retry_base_delay * 2 ** attempt)
+                retry_after = getattr(getattr(ex, 'response', None), 'headers', {}).get('Retry-After')
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+
+                LOGGER.warning('Getting %s data failed with status %s, retrying in %.2f seconds.', player, ex.status, delay)
+                await asyncio.sleep(delay)
+
+    async def __try_fetch_data(self, player: str) -> coc.abc.BasePlayer:
+        """
+        Gets the player's data from the API, unless the player should be
+        skipped. Errors are logged rather than raised, so that one player
+        does not stop the others from being scraped.
+
+        Parameters
+        ----------
+        player : str
+            The player tag to get data for.
+
+        Returns
+        -------
+        coc.abc.BasePlayer
+            The player data, or None if the player is skipped or could not
+            be fetched.
+        """
+
+        if self.__is_unknown_player(player):
+            LOGGER.info('Abandoning scrape for %s because it was recently not found.', player)
             return None
 
-        entities = await self.__get_data(player)
-        self.table_handler.write_data_to_table(entities=entities)
+        try:
+            should_abandon_scrape = self.abandon_scrape_if_entity_exists and await asyncio.to_thread(self.__does_player_data_exist, player)
+            if should_abandon_scrape:
+                LOGGER.info('Abandoning scrape for %s because it already exists.', player)
+                return None
+
+            return await self.__get_player_with_retry(player)
+        except coc.NotFound as ex:
+            LOGGER.error('Player %s was not found, skipping it for %s seconds.', player, self.unknown_player_ttl)
+            LOGGER.error(str(ex))
+            PlayerTableHandler.unknown_players[player] = time.monotonic() + self.unknown_player_ttl
+        except Exception as ex:
+            LOGGER.error('Unable to get %s data.', player)
+            LOGGER.error(str(ex))
+
+    async def __update_tables(self, players: Iterator[str]) -> None:
+        """
+        Updates the table with the input players' data. Fetching from the
+        Clash of Clans API and writing to the tables run as a pipeline:
+        `max_concurrency` fetch workers put player data on a player queue
+        and a troop queue, each drained by `write_concurrency` write
+        workers, so a player's base and troop data are written in parallel
+        while the next players are being fetched.
+
+        Parameters
+        ----------
+        players : collections.abc.Iterable[str]
+            The player tags to update the table with.
+
+        Returns
+        -------
+        None
+        """
+
+        players = [player for player in players if player is not None]
+        self.__row_key = None
+        await asyncio.to_thread(self.__preload_existing_data, players)
+
+        pending_players = iter(players)
+        fetched_players = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        fetched_troops = asyncio.Queue(maxsize=self.pipeline_queue_size)
+
+        async def fetch_worker() -> None:
+            # The iterator is shared, so each player is taken by exactly one
+            # fetch worker.
+            for player in pending_players:
+                LOGGER.debug('Fetching player %s data.', player)
+
+                data = await self.__try_fetch_data(player)
+                if data is not None:
+                    await fetched_players.put((player, data))
+                    await fetched_troops.put((player, data))
+
+        async def write_worker() -> None:
+            while True:
+                player, data = await fetched_players.get()
+                try:
+                    LOGGER.debug('Updating table with player %s data.', player)
+                    await self.__write_data(data)
+                except Exception as ex:
+                    LOGGER.error('Unable to update table with %s data.', player)
+                    LOGGER.error(str(ex))
+                finally:
+                    fetched_players.task_done()
+
+        async def troop_write_worker() -> None:
+            while True:
+                player, data = await fetched_troops.get()
+                try:
+                    LOGGER.debug('Updating troop table with player %s data.', player)
+                    await self.__write_troop_data(data)
+                except Exception as ex:
+                    LOGGER.error('Unable to update troop table with %s data.', player)
+                    LOGGER.error(str(ex))
+                finally:
+                    fetched_troops.task_done()
+
+        write_workers = [asyncio.create_task(write_worker()) for _ in range(self.write_concurrency)]
+        write_workers += [asyncio.create_task(troop_write_worker()) for _ in range(self.write_concurrency)]
+        try:
+            await asyncio.gather(*[fetch_worker() for _ in range(self.max_concurrency)])
+            await fetched_players.join()
+            await fetched_troops.join()
+        finally:
+            for task in write_workers:
+                task.cancel()
+            await asyncio.gather(*write_workers, return_exceptions=True)
 
     async def scrape_location_players(self, players: Iterator[coc.players.RankedPlayer], coc_client_handling: bool = True) -> None:
         """
@@ -237,17 +493,16 @@ class PlayerTableHandler(CocClientHandler):
         None
         """
 
+        player_tags = [try_get_attr(player, 'tag') for player in players]
+        if not player_tags:
+            LOGGER.debug('No location players to scrape.')
+            return None
+
         if coc_client_handling:
             await self.start_coc_client_session()
         
-        LOGGER.debug(f'Player table {self.table_name} is updating.')
-        for player in players:
-            try:
-                LOGGER.debug(f'Updating table with {try_get_attr(player, "tag")}\'s data.')
-                await self.__update_table(player=try_get_attr(player, 'tag'))
-            except Exception as ex:
-                LOGGER.error(f'Error updating table with {try_get_attr(player, "tag")}\'s data.')
-                LOGGER.error(ex)
+        LOGGER.debug('Player table %s is updating.', self.table_name)
+        await self.__update_tables(player_tags)
 
         if coc_client_handling:
             await self.close_coc_client_session()
@@ -269,17 +524,16 @@ class PlayerTableHandler(CocClientHandler):
         None
         """
 
+        member_tags = list(member_tags)
+        if not member_tags:
+            LOGGER.debug('No clan members to scrape.')
+            return None
+
         if coc_client_handling:
             await self.start_coc_client_session()
 
-        LOGGER.debug(f'Player table {self.table_name} is updating.')
-        for member_tag in member_tags:
-            try:
-                LOGGER.debug(f'Updating table with player {member_tag} data.')
-                await self.__update_table(player=member_tag)
-            except Exception as ex:
-                LOGGER.error(f'Unable to update table with {member_tag} data.')
-                LOGGER.error(str(ex))
+        LOGGER.debug('Player table %s is updating.', self.table_name)
+        await self.__update_tables(member_tags)
 
         if coc_client_handling:
             await self.close_coc_client_session()
@@ -299,20 +553,19 @@ class PlayerTableHandler(CocClientHandler):
         None
         """
 
+        if not self.scrape_enabled:
+            LOGGER.info('Player table %s is not updated because PlayerSettings.ScrapeEnabled is %s.', self.table_name, self.scrape_enabled)
+            return None
+
+        if not self.players:
+            LOGGER.debug('No players to scrape.')
+            return None
+
         if coc_client_handling:
             await self.start_coc_client_session()
 
-        if self.scrape_enabled:
-            LOGGER.debug(f'Player table {self.table_name} is updating.')
-            for player in self.players:
-                try:
-                    LOGGER.debug(f'Updating table with player {player} data.')
-                    await self.__update_table(player)
-                except Exception as ex:
-                    LOGGER.error(f'Unable to update table with {player} data.')
-                    LOGGER.error(str(ex))
-        else:
-            LOGGER.info(f'Player table {self.table_name} is not updated because PlayerSettings.ScrapeEnabled is {self.scrape_enabled}.')
+        LOGGER.debug('Player table %s is updating.', self.table_name)
+        await self.__update_tables(self.players)
 
         if coc_client_handling:
-                await self.close_coc_client_session()
\ No newline at end of file
+            await self.close_coc_client_session()
@@ -1,18 +1,23 @@
+import time
+import random
 import logging
+import requests
+import threading
 import concurrent.futures
 
 from scraper import CONFIG
-from functools import partial
 from collections.abc import Iterator
+from requests.adapters import HTTPAdapter
 from azure.core.exceptions import ResourceExistsError
 from azure.core.exceptions import ResourceNotFoundError
 from azure.core.exceptions import ClientAuthenticationError
-from azure.core.exceptions import ServiceResponseError
-from azure.core.exceptions import ServiceResponseTimeoutError
 from azure.core.credentials import AzureNamedKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
 from azure.data.tables import TableServiceClient
 from azure.data.tables import TableClient
 from azure.data.tables import TableEntity
+from azure.data.tables import TableTransactionError
+from azure.data.tables import UpdateMode
 
 logging.getLogger('azure').setLevel(logging.WARNING)
 LOGGER = logging.getLogger(__name__)
@@ -50,17 +55,75 @@ class TableStorageHandler(object):
     thread_worker_count : int
         The number of threads to use when writing data to the table in Azure
         Table Storage.
+    max_parallel_writes : int
+        The number of batch transactions for different partitions sent to
+        Azure Table Storage at the same time.
+    max_buffered_entities : int
+        The number of entities held in open batches before the oldest batch
+        is sent, even if it is not full.
+    retry_total : int
+        The number of times the SDK retries a request that failed with a
+        transient error, e.g. throttling (429) or server busy (503).
+    retry_backoff_factor : float
+        The backoff factor in seconds between retries.
+    retry_backoff_max : float
+        The maximum backoff in seconds between retries.
+    retry_mode : str
+        The SDK backoff mode between retries, "exponential" or "fixed".
+    connection_pool_count : int
+        The number of per-host connection pools kept by the HTTP session.
+    connection_pool_size : int
+        The number of connections kept open in each connection pool.
+    row_key_exists_cache : dict[tuple[str,str], bool]
+        Shared across all handlers, caches whether a (table name, row key)
+        pair has at least one entity in the table for the current run.
+    row_key_exists_cache_lock : threading.Lock
+        Shared across all handlers, guards `row_key_exists_cache`, which is
+        read and cleared by concurrent write threads.
+    table_service_client_cache : dict[tuple[str,str,str], azure.data.tables.TableServiceClient]
+        Shared across all handlers, maps credentials to the
+        TableServiceClient connected with them.
+    known_tables : set[tuple[str,str]]
+        Shared across all handlers, the (account name, table name) pairs of
+        tables known to exist.
+    written_entities : set[tuple[str,str,str]]
+        Shared across all handlers, the (table name, partition key, row key)
+        triples of entities written during the current run.
+    transport : azure.core.pipeline.transport.RequestsTransport
+        Shared across all handlers, the HTTP transport and connection pool
+        used by every TableServiceClient.
+    entity_executor : concurrent.futures.ThreadPoolExecutor
+        Shared across all handlers, the thread pool writing entities one by
+        one, created on first use.
+    batch_executor : concurrent.futures.ThreadPoolExecutor
+        Shared across all handlers, the thread pool submitting batch
+        transactions, created on first use.
+    executor_lock : threading.Lock
+        Shared across all handlers, guards the creation of the thread pools.
 
     Methods
     -------
-    write_data_to_table(entities: collections.abc.Iterable[azure.data.tables.TableEntity]) -> None
+    write_data_to_table(entities: collections.abc.Iterable[azure.data.tables.TableEntity], batch: bool = True) -> None
         Writes the given entities to the table in Azure Table Storage.
+    write_batch_data_to_table(entities: collections.abc.Iterable[azure.data.tables.TableEntity]) -> None
+        Writes the given entities to the table in Azure Table Storage using
+        batch transactions grouped by partition key.
     try_get_entity(partition_key: str, row_key: str, retries_remaining: int = 0, **kwargs) -> azure.data.tables.TableEntity
         Attempts to get an entity from the table in Azure Table Storage.
-    try_query_entities(filter: str, retries_remaining: int = 0, **kwargs) -> azure.data.tables.ItemPaged[azure.data.tables.TableEntity]
+    try_query_entities(filter: str, retries_remaining: int = 0, select: str | list[str] = None, **kwargs) -> azure.data.tables.ItemPaged[azure.data.tables.TableEntity]
         Attempts to query entities from the table in Azure Table Storage.
+    does_row_key_exist(row_key: str, retries_remaining: int = 0) -> bool
+        Checks if any entity in the table has the given row key.
+    does_entity_exist(partition_key: str, row_key: str, retries_remaining: int = 0) -> bool
+        Checks if the entity with the given keys exists in the table.
+    try_query_partitions(partition_keys: collections.abc.Iterable[str], query_filter: str = None, **kwargs) -> collections.abc.Iterator[azure.data.tables.TableEntity]
+        Queries the entities in the given partitions.
+    try_query_existing_partition_keys(partition_keys: collections.abc.Iterable[str], query_filter: str = None) -> set[str]
+        Finds which of the given partition keys have entities in the table.
     """
 
+    __slots__ = ('table_name', 'table_service_client', 'table_client')
+
     configs = CONFIG['StorageHandlerSettings']
     upsert_enabled = configs['UpsertAtFailedPushEnabled']
     retry_entity_creation_enabled = configs['RetryEntityCreationEnabled']
@@ -68,6 +131,32 @@ class TableStorageHandler(object):
     retry_entity_extraction_enabled = configs['RetryEntityExtractionEnabled']
     retry_entity_extraction_count = configs['RetryEntityExtractionCount']
     thread_worker_count = configs['ThreadWorkerCount']
+    max_parallel_writes = configs['MaxParallelWrites']
+    max_buffered_entities = configs['MaxBufferedEntities']
+    retry_total = configs['RetryTotal']
+    retry_backoff_factor = configs['RetryBackoffFactor']
+    retry_backoff_max = configs['RetryBackoffMax']
+    retry_mode = configs['RetryMode']
+    connection_pool_count = configs['ConnectionPoolCount']
+    connection_pool_size = configs['ConnectionPoolSize']
+    row_key_exists_cache = dict()
+    row_key_exists_cache_lock = threading.Lock()
+    table_service_client_cache = dict()
+    known_tables = set()
+    written_entities = set()
+    transport = None
+    entity_executor = None
+    batch_executor = None
+    executor_lock = threading.Lock()
+    # Azure Table Storage limits a transaction to 100 operations and a 4 MiB
+    # payload; the byte budget leaves headroom for the request envelope.
+    max_batch_size = 100
+    max_batch_bytes = 4_000_000
+    # Azure Table Storage allows at most 15 comparisons in a query filter,
+    # leaving room for the extra comparisons in the caller's filter.
+    max_partition_keys_per_query = 10
+    # Azure Table Storage returns at most 1000 entities per page.
+    max_results_per_page = 1000
 
     def __init__(
             self,
@@ -90,21 +179,167 @@ class TableStorageHandler(object):
 
         # Azure Table Storage Client
         self.table_name = table_name
-        self.__account_name = account_name
-        self.__access_key = access_key
-        self.__connection_string = connection_string
-
         self.table_service_client = self.connect_table_service_client(account_name=account_name, access_key=access_key, connection_string=connection_string)
         self.table_client = self.connect_table_client(table_service_client=self.table_service_client, table_name=self.table_name)
 
-    @staticmethod
+    @classmethod
     def connect_table_service_client(
+            cls,
             account_name: str = None,
             access_key: str = None,
             connection_string: str = None) -> TableServiceClient:
         """
         Connects to the TableServiceClient object in Azure Table Storage
-        based on the given credentials.
+        based on the given credentials. Clients are cached by credentials,
+        so handlers created with the same credentials share one client and
+        its connection pool.
+        
+        Parameters
+        ----------
+        account_name : str, optional
+            (Default: None) The account name of the Azure Table Storage.
+        access_key : str, optional
+            (Default: None) The access key of the Azure Table Storage.
+        connection_string : str, optional
+            (Default: None) The connection string of the Azure Table Storage.
+
+        Returns
+        -------
+        azure.data.tables.TableServiceClient
+            The TableServiceClient object connected to the Azure Table Storage.
+        """
+
+        key = (account_name, access_key, connection_string)
+        table_service_client = cls.table_service_client_cache.get(key)
+        if table_service_client is None:
+            table_service_client = cls.__create_table_service_client(account_name=account_name, access_key=access_key, connection_string=connection_string)
+            if table_service_client is not None:
+                cls.table_service_client_cache[key] = table_service_client
+        return table_service_client
+
+    @classmethod
+    def __get_client_kwargs(cls) -> dict:
+        """
+        Gets the keyword arguments passed to the TableServiceClient. Transient
+        errors are retried by the SDK with backoff, and requests are sent
+        through a connection pool large enough for the parallel writes. The
+        transport is created once and shared by every service client, and
+        the table clients created from them, so rebuilt clients keep the
+        pooled connections.
+
+        Returns
+        -------
+        dict
+            The keyword arguments configuring the SDK's retry policy and
+            transport.
+        """
+
+        if TableStorageHandler.transport is None:
+            # Retries are left to the SDK's retry policy, not the adapter.
+            adapter = HTTPAdapter(pool_connections=cls.connection_pool_count, pool_maxsize=cls.connection_pool_size, max_retries=0)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            TableStorageHandler.transport = RequestsTransport(session=session, session_owner=True)
+
+        return {
+            'retry_total': cls.retry_total,
+            'retry_backoff_factor': cls.retry_backoff_factor,
+            'retry_backoff_max': cls.retry_backoff_max,
+            'retry_mode': cls.retry_mode,
+            'transport': TableStorageHandler.transport
+        }
+
+    @classmethod
+    def __get_retry_delay(cls, attempt: int) -> float:
+        """
+        Gets the time to wait before retrying after an authentication error.
+        The delay grows exponentially with each attempt and is jittered, so
+        threads that failed together do not retry together.
+
+        Parameters
+        ----------
+        attempt : int
+            The number of retries already made.
+
+        Returns
+        -------
+        float
+            The number of seconds to wait before retrying.
+        """
+
+        return min(cls.retry_backoff_max, cls.retry_backoff_factor * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    @classmethod
+    def __get_worker_count(cls, worker_count: int) -> int:
+        """
+        Gets the number of threads to send requests with. Threads beyond
+        the size of the connection pool would only wait for a connection,
+        so the count is capped at `connection_pool_size`.
+
+        Parameters
+        ----------
+        worker_count : int
+            The configured number of threads.
+
+        Returns
+        -------
+        int
+            The number of threads to use.
+        """
+
+        if worker_count > cls.connection_pool_size:
+            LOGGER.warning('%s threads configured but the connection pool holds %s connections, using %s threads.', worker_count, cls.connection_pool_size, cls.connection_pool_size)
+            return cls.connection_pool_size
+        return worker_count
+
+    @classmethod
+    def __get_entity_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        Gets the thread pool that writes entities one by one, creating it on
+        first use. The pool is shared across all handlers and calls.
+
+        Returns
+        -------
+        concurrent.futures.ThreadPoolExecutor
+            The thread pool for single entity writes.
+        """
+
+        with TableStorageHandler.executor_lock:
+            if TableStorageHandler.entity_executor is None:
+                TableStorageHandler.entity_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=cls.__get_worker_count(cls.thread_worker_count),
+                    thread_name_prefix='TableEntityWriter')
+        return TableStorageHandler.entity_executor
+
+    @classmethod
+    def __get_batch_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        Gets the thread pool that submits batch transactions, creating it on
+        first use. The pool is shared across all handlers and calls. It is
+        separate from the entity pool since a failed batch waits on the
+        entity pool for its one by one writes.
+
+        Returns
+        -------
+        concurrent.futures.ThreadPoolExecutor
+            The thread pool for batch transactions.
+        """
+
+        with TableStorageHandler.executor_lock:
+            if TableStorageHandler.batch_executor is None:
+                TableStorageHandler.batch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=cls.__get_worker_count(cls.max_parallel_writes),
+                    thread_name_prefix='TableBatchWriter')
+        return TableStorageHandler.batch_executor
+
+    @staticmethod
+    def __create_table_service_client(
+            account_name: str = None,
+            access_key: str = None,
+            connection_string: str = None) -> TableServiceClient:
+        """
+        Creates a new TableServiceClient object based on the given
+        credentials.
         
         Parameters
         ----------
@@ -125,11 +360,11 @@ class TableStorageHandler(object):
             connection_string is None):
             LOGGER.error('At least one of (account_name + access_key) or connection_string must contain a value.')
 
-        LOGGER.debug(f'Connecting to table service client.')
+        LOGGER.debug('Connecting to table service client.')
         if (connection_string is not None):
             try:
                 LOGGER.debug('Attempting connection via connection string.')
-                return TableServiceClient.from_connection_string(conn_str=connection_string)
+                return TableServiceClient.from_connection_string(conn_str=connection_string, **TableStorageHandler.__get_client_kwargs())
             except Exception as ex:
                 LOGGER.error('Connection attempt via connection string failed.')
                 LOGGER.error(str(ex))
@@ -138,16 +373,17 @@ class TableStorageHandler(object):
             try:
                 LOGGER.debug('Attempting connection via account name and access key.')
                 credential = AzureNamedKeyCredential(account_name, access_key)
-                return TableServiceClient(endpoint=f'https://{account_name}.table.core.windows.net/', credential=credential)
+                return TableServiceClient(endpoint=f'https://{account_name}.table.core.windows.net/', credential=credential, **TableStorageHandler.__get_client_kwargs())
             except Exception as ex:
                 LOGGER.error('Connection attempt via account name and access key failed.')
                 LOGGER.error(str(ex))
 
-    @staticmethod
-    def connect_table_client(table_service_client: TableServiceClient, table_name:str) -> TableClient:
+    @classmethod
+    def connect_table_client(cls, table_service_client: TableServiceClient, table_name:str) -> TableClient:
         """
         Connects to the TableClient object in Azure Table Storage based on
-        the given table name.
+        the given table name. The table is created if it does not exist;
+        tables already known to exist are connected to without a request.
 
         Parameters
         ----------
@@ -162,25 +398,37 @@ class TableStorageHandler(object):
             The TableClient object connected to the table in Azure Table Storage.
         """
 
+        if table_service_client is None:
+            LOGGER.error('No table service client to connect to table client %s.', table_name)
+            return None
+
+        key = (table_service_client.account_name, table_name)
+        if key in cls.known_tables:
+            return table_service_client.get_table_client(table_name=table_name)
+
         try:
-            LOGGER.debug(f'Connecting to table client {table_name}.')
-            return table_service_client.create_table_if_not_exists(table_name=table_name)
+            LOGGER.debug('Connecting to table client %s.', table_name)
+            table_client = table_service_client.create_table_if_not_exists(table_name=table_name)
+            cls.known_tables.add(key)
+            return table_client
         except Exception as ex:
-            LOGGER.error(f'Failed to connect to table client {table_name}.')
+            LOGGER.error('Failed to connect to table client %s.', table_name)
             LOGGER.error(str(ex))
 
-    @classmethod
     def try_create_or_upsert_entity_with_retry(
             self,
             entity: TableEntity, 
-            retries_remaining: int = 0,
-            **kwargs) -> str:
+            retries_remaining: int = 0) -> None:
         """
         Attempts to create or upsert the given entity in the table in Azure
-        Table Storage. If the entity already exists, it will be updated with
-        the new values. If the entity does not exist, it will be created.
+        Table Storage. If upserting is enabled, the entity is upserted in a
+        single request, merging the new values into any existing entity.
+        Otherwise it is created, and skipped if it already exists.
 
         This function will be retried if a client authentication error occurs.
+        The retry reuses the same client and credentials, so it only helps
+        with transient failures such as clock skew. Other transient errors
+        are retried by the SDK's retry policy instead.
         
         Parameters
         ----------
@@ -192,55 +440,57 @@ class TableStorageHandler(object):
         
         Returns
         -------
-        str
-            A message indicating the result of the operation.
+        None
         """
 
         assert retries_remaining >= 0, 'Retries remaining must be greater than or equal to 0.'
 
-        table_client: TableClient = kwargs.get('table_client', None)
-        table_name: str = kwargs.get('table_name', None)
+        table_name = self.table_name
 
-        account_name: str = kwargs.get('account_name', None)
-        access_key: str = kwargs.get('access_key', None)
-        connection_string: str = kwargs.get('connection_string', None)
+        # Without upserting, an entity written during this run would only be
+        # rejected as existing, so the request is not sent.
+        if not self.upsert_enabled and (table_name, entity['PartitionKey'], entity['RowKey']) in TableStorageHandler.written_entities:
+            LOGGER.debug('Skipped entity with PartitionKey %s and RowKey %s already written to %s.', entity['PartitionKey'], entity['RowKey'], table_name)
+            return None
 
+        attempt = 0
+        while True:
+            try:
+                # An upsert is a single request whether or not the entity
+                # exists, so it is sent directly instead of after a failed create.
+                if self.upsert_enabled:
+                    LOGGER.debug('Attempting upsert of entity %s to %s', entity["PartitionKey"], table_name)
+                    self.table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+                    TableStorageHandler.written_entities.add((table_name, entity['PartitionKey'], entity['RowKey']))
+                    LOGGER.debug('Upserted entity with PartitionKey %s and RowKey %s in %s.', entity['PartitionKey'], entity['RowKey'], table_name)
+                    return None
+
+                LOGGER.debug('Attempting to create entity %s in %s.', entity["PartitionKey"], table_name)
+                self.table_client.create_entity(entity=entity)
+                TableStorageHandler.written_entities.add((table_name, entity['PartitionKey'], entity['RowKey']))
+                LOGGER.debug('Created entity with PartitionKey %s and RowKey %s in %s.', entity['PartitionKey'], entity['RowKey'], table_name)
+                return None
+            except ResourceExistsError:
+                LOGGER.debug('Entity %s already exists in %s.', entity["PartitionKey"], table_name)
+                return None
+            except ClientAuthenticationError as ex:
+                LOGGER.error('Encountered %s, retrying entity creation with the same client.', type(ex))
+                LOGGER.error(str(ex))
 
-        try:
-            LOGGER.debug(f'Attempting to create or upsert entity {entity["PartitionKey"]} in {kwargs.get("table_name", None)}.')
-            table_client.create_entity(entity=entity)
-            return f'Created entity with PartitionKey {entity["PartitionKey"]} and RowKey {entity["RowKey"]} in {kwargs.get("table_name", None)}.'
-        except ResourceExistsError:
-            LOGGER.debug(f'Entity {entity["PartitionKey"]} already exists in {table_name}.')
-
-            if self.upsert_enabled:
-                try:
-                    LOGGER.debug(f'Attempting upsert of entity {entity["PartitionKey"]} to {table_name}')
-                    table_client.upsert_entity(entity=entity)
-                    return f'Upserted entity with PartitionKey {entity["PartitionKey"]} and RowKey {entity["RowKey"]} in {kwargs.get("table_name", None)}.'
-                except Exception as ex:
-                    LOGGER.error('Failed to upsert entity.')
-                    LOGGER.error(str(ex))
-        except (ClientAuthenticationError, ServiceResponseError, ServiceResponseTimeoutError) as ex:
-            LOGGER.error(f'Encountered {type(ex)}, attempting re-login and retry entity creation.')
-            LOGGER.error(str(ex))
-            table_service_client = self.connect_table_service_client(account_name=account_name, access_key=access_key, connection_string=connection_string)
-            table_client = self.connect_table_client(table_service_client=table_service_client, table_name=table_name)
-
-            if self.retry_entity_creation_enabled and retries_remaining > 0:
-                LOGGER.debug(f'Retrying entity creation {retries_remaining} more times.')
-                self.try_create_or_upsert_entity_with_retry(
-                    entity=entity, 
-                    retries_remaining=retries_remaining-1,
-                    table_client=table_client,
-                    table_name=table_name,
-                    account_name=account_name,
-                    access_key=access_key,
-                    connection_string=connection_string)
-            else:
-                LOGGER.warning('Entity creation retry limit reached / Retry not enabled, skipping entity creation.')
-
-    def write_data_to_table(self, entities: Iterator[TableEntity]) -> None:
+                if not self.retry_entity_creation_enabled or retries_remaining <= 0:
+                    LOGGER.warning('Entity creation retry limit reached / Retry not enabled, skipping entity creation.')
+                    return None
+
+                LOGGER.debug('Retrying entity creation %s more times.', retries_remaining)
+                time.sleep(self.__get_retry_delay(attempt))
+                attempt += 1
+                retries_remaining -= 1
+            except Exception as ex:
+                LOGGER.error('Failed to create or upsert entity %s in %s.', entity["PartitionKey"], table_name)
+                LOGGER.error(str(ex))
+                return None
+
+    def write_data_to_table(self, entities: Iterator[TableEntity], batch: bool = True) -> None:
         """
         Writes the given entities to the table in Azure Table Storage.
 
@@ -248,33 +498,192 @@ class TableStorageHandler(object):
         ----------
         entities : collections.abc.Iterable[azure.data.tables.TableEntity]
             The entities to be written to the table in Azure Table Storage.
+        batch : bool, optional
+            (Default: True) Whether or not to send the entities in batch
+            transactions grouped by partition key, see
+            `write_batch_data_to_table`. Otherwise each entity is created,
+            or upserted, with its own request.
 
         Returns
         -------
         None
         """
-        
-        LOGGER.debug(f'Writing entities to the table {self.table_name}.')
-        try_create_or_upsert_entity = partial(
-            self.try_create_or_upsert_entity_with_retry, 
-            table_client=self.table_client, 
-            table_name=self.table_name, 
-            account_name=self.__account_name, 
-            access_key=self.__access_key, 
-            connection_string=self.__connection_string,
-            retries_remaining=self.retry_entity_creation_count)
-            
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_worker_count) as executor:
-            LOGGER.debug(f'Running thread executor with at most {executor._max_workers} threads.')
+
+        if batch:
+            return self.write_batch_data_to_table(entities=entities)
+
+        # Each entity is sent once; later duplicates are skipped as they are
+        # read, so the entities are streamed rather than collected up front.
+        seen_keys = set()
+
+        LOGGER.debug('Writing entities to the table %s.', self.table_name)
+        executor = self.__get_entity_executor()
+        LOGGER.debug('Running thread executor with at most %s threads.', executor._max_workers)
+        # Only a few writes per thread are queued at a time, so the entities
+        # are not all turned into pending futures up front.
+        max_pending_writes = 2 * executor._max_workers
+        pending = set()
+        for entity in entities:
+            key = (entity['PartitionKey'], entity['RowKey'])
+            if key in seen_keys:
+                LOGGER.debug('Skipped duplicate entity with PartitionKey %s and RowKey %s.', key[0], key[1])
+                continue
+            seen_keys.add(key)
+
+            if len(pending) >= max_pending_writes:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                self.__check_write_results(done)
+            pending.add(executor.submit(self.try_create_or_upsert_entity_with_retry, entity, self.retry_entity_creation_count))
+
+        done, _ = concurrent.futures.wait(pending)
+        self.__check_write_results(done)
+        LOGGER.debug('Pool threads complete.')
+        LOGGER.debug('Sent all entities to table %s.', self.table_name)
+        self.__clear_row_key_exists_cache()
+
+    @staticmethod
+    def __check_write_results(futures: Iterator[concurrent.futures.Future]) -> None:
+        """
+        Logs the errors raised by finished single entity writes.
+
+        Parameters
+        ----------
+        futures : collections.abc.Iterable[concurrent.futures.Future]
+            The finished writes.
+
+        Returns
+        -------
+        None
+        """
+
+        for future in futures:
             try:
-                results = executor.map(try_create_or_upsert_entity, entities)
-                for result in results:
-                    LOGGER.debug(result)
+                future.result()
             except Exception as ex:
                 LOGGER.error(str(ex))
-                LOGGER.error(f'Exception type: {type(ex)}')
-            LOGGER.debug(f'Pool threads complete.')
-        LOGGER.debug(f'Sent all entities to table {self.table_name}.')
+                LOGGER.error('Exception type: %s', type(ex))
+
+    def write_batch_data_to_table(self, entities: Iterator[TableEntity]) -> None:
+        """
+        Writes the given entities to the table in Azure Table Storage using
+        batch transactions. Entities are grouped by partition key and sent
+        in transactions of at most 100 operations and roughly 4 MB. The
+        entities are streamed: a partition's batch is submitted as soon as
+        it is full, so only the open batches are held in memory. At most
+        `max_buffered_entities` entities are held in open batches. Duplicate
+        entities within an open batch are sent once, as the later one. Batches
+        are submitted by up to `max_parallel_writes` threads, shared by all
+        handlers. If a transaction fails, its entities are written one by
+        one instead.
+
+        Parameters
+        ----------
+        entities : collections.abc.Iterable[azure.data.tables.TableEntity]
+            The entities to be written to the table in Azure Table Storage.
+
+        Returns
+        -------
+        None
+        """
+
+        LOGGER.debug('Writing entities to the table %s in batches.', self.table_name)
+        # Transactions for different partitions are independent, so they are
+        # submitted in parallel to overlap their round-trips.
+        executor = self.__get_batch_executor()
+        futures = []
+        # Maps each partition key to its open batch, keyed by row key,
+        # and the batch's approximate size in bytes.
+        open_batches = dict()
+        buffered_entities = 0
+        for entity in entities:
+            partition_key = entity['PartitionKey']
+            row_key = entity['RowKey']
+            batch, batch_bytes = open_batches.get(partition_key, ({}, 0))
+
+            entity_bytes = sum(len(str(key)) + len(str(value)) for key, value in entity.items())
+            # A transaction may not touch the same entity twice, so a
+            # duplicate replaces the earlier entity in the open batch.
+            if row_key not in batch and batch and (len(batch) >= self.max_batch_size or batch_bytes + entity_bytes > self.max_batch_bytes):
+                futures.append(executor.submit(self.__submit_batch, partition_key, list(batch.values())))
+                buffered_entities -= len(batch)
+                batch, batch_bytes = {}, 0
+
+            if row_key not in batch:
+                buffered_entities += 1
+            batch[row_key] = entity
+            open_batches[partition_key] = (batch, batch_bytes + entity_bytes)
+
+            # With many partitions, the open batches would otherwise hold
+            # most of the input; the least recently opened batch is sent
+            # early, even if it is not full, to bound memory.
+            if buffered_entities > self.max_buffered_entities:
+                oldest_partition_key = next(iter(open_batches))
+                oldest_batch, _ = open_batches.pop(oldest_partition_key)
+                futures.append(executor.submit(self.__submit_batch, oldest_partition_key, list(oldest_batch.values())))
+                buffered_entities -= len(oldest_batch)
+
+        for partition_key, (batch, _) in open_batches.items():
+            futures.append(executor.submit(self.__submit_batch, partition_key, list(batch.values())))
+
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+        LOGGER.debug('Sent all entities to table %s.', self.table_name)
+        self.__clear_row_key_exists_cache()
+
+    def __submit_batch(self, partition_key: str, batch: list[TableEntity]) -> None:
+        """
+        Submits the given entities as a single transaction. If the
+        transaction fails, the entities are written one by one instead.
+
+        Parameters
+        ----------
+        partition_key : str
+            The partition key shared by all the entities in the batch.
+        batch : list[azure.data.tables.TableEntity]
+            The entities to be sent in one transaction.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.upsert_enabled:
+            operations = [('upsert', entity, {'mode': UpdateMode.MERGE}) for entity in batch]
+        else:
+            # Creating an entity that exists fails the whole transaction, so
+            # entities already written during this run are left out.
+            batch = [entity for entity in batch if (self.table_name, partition_key, entity['RowKey']) not in TableStorageHandler.written_entities]
+            if not batch:
+                return None
+            operations = [('create', entity) for entity in batch]
+
+        try:
+            LOGGER.debug('Submitting batch of %s entities with PartitionKey %s to %s.', len(batch), partition_key, self.table_name)
+            self.table_client.submit_transaction(operations)
+            TableStorageHandler.written_entities.update((self.table_name, partition_key, entity['RowKey']) for entity in batch)
+        except TableTransactionError as ex:
+            LOGGER.warning('Batch with PartitionKey %s failed, writing its entities one by one.', partition_key)
+            LOGGER.warning(str(ex))
+            self.write_data_to_table(entities=batch, batch=False)
+        except Exception as ex:
+            LOGGER.error('Failed to submit batch with PartitionKey %s to %s, writing its entities one by one.', partition_key, self.table_name)
+            LOGGER.error(str(ex))
+            self.write_data_to_table(entities=batch, batch=False)
+
+    def __clear_row_key_exists_cache(self) -> None:
+        """
+        Removes the cached row key lookups for this table. New entities may
+        have been written, so those lookups are no longer reliable.
+
+        Returns
+        -------
+        None
+        """
+
+        with TableStorageHandler.row_key_exists_cache_lock:
+            for key in [key for key in TableStorageHandler.row_key_exists_cache if key[0] == self.table_name]:
+                TableStorageHandler.row_key_exists_cache.pop(key, None)
 
     def try_get_entity(
             self, 
@@ -305,32 +714,38 @@ class TableStorageHandler(object):
 
         assert retries_remaining >= 0, 'Retries remaining must be greater than or equal to 0.'
 
-        try:
-            LOGGER.debug(f'Attempting to get entity with partition key {partition_key} and row key {row_key}.')
-            return self.table_client.get_entity(partition_key=partition_key, row_key=row_key, **kwargs)
-        except ResourceNotFoundError as ex:
-            LOGGER.debug(f'Entity with partition key {partition_key} and row key {row_key} not found.')
-            LOGGER.debug(str(ex))
-            return None
-        except ClientAuthenticationError as ex:
-            LOGGER.error('Client authentication error encountered, attempting re-login and retry entity extraction.')
-            LOGGER.error(str(ex))
-            self.table_service_client = self.connect_table_service_client(account_name=self.__account_name, access_key=self.__access_key, connection_string=self.__connection_string)
-            self.table_client = self.connect_table_client(table_service_client=self.table_service_client, table_name=self.table_name)
+        attempt = 0
+        while True:
+            try:
+                LOGGER.debug('Attempting to get entity with partition key %s and row key %s.', partition_key, row_key)
+                return self.table_client.get_entity(partition_key=partition_key, row_key=row_key, **kwargs)
+            except ResourceNotFoundError as ex:
+                LOGGER.debug('Entity with partition key %s and row key %s not found.', partition_key, row_key)
+                LOGGER.debug(str(ex))
+                return None
+            except ClientAuthenticationError as ex:
+                LOGGER.error('Client authentication error encountered, retrying entity extraction with the same client.')
+                LOGGER.error(str(ex))
 
-            if self.retry_entity_extraction_enabled and retries_remaining > 0:
-                LOGGER.debug(f'Retrying entity extraction {retries_remaining} more times.')
-                self.try_get_entity(partition_key=partition_key, row_key=row_key, retries_remaining=retries_remaining-1, **kwargs)
-            else:
-                LOGGER.debug('Entity extraction retry limit reached / Retry not enabled, skipping entity creation.')
+                if not self.retry_entity_extraction_enabled or retries_remaining <= 0:
+                    LOGGER.debug('Entity extraction retry limit reached / Retry not enabled, skipping entity extraction.')
+                    return None
+
+                LOGGER.debug('Retrying entity extraction %s more times.', retries_remaining)
+                time.sleep(self.__get_retry_delay(attempt))
+                attempt += 1
+                retries_remaining -= 1
 
     def try_query_entities(
             self, 
             query_filter: str,
             retries_remaining: int = 0,
+            select: str | list[str] = None,
             **kwargs) -> Iterator[TableEntity]:
         """
         Attempts to query the entities in the table with the given filter.
+        Unless `results_per_page` is given, results are fetched in pages of
+        `max_results_per_page` entities.
 
         Parameters
         ----------
@@ -339,6 +754,9 @@ class TableStorageHandler(object):
         retries_remaining : int, optional
             (Default: 0) The number of retries remaining to attempt to query
             the entities in the table with the given filter.
+        select : str | list[str], optional
+            (Default: None) The properties to return for each entity. If not
+            given, all properties are returned.
         **kwargs
             Additional keyword arguments to pass to the query_entities method.
 
@@ -350,17 +768,152 @@ class TableStorageHandler(object):
 
         assert retries_remaining >= 0, 'retries_remaining must be greater than or equal to 0.'
 
-        try:
-            LOGGER.debug(f'Attempting to query entities with filter {query_filter}.')
-            return self.table_client.query_entities(query_filter=query_filter, **kwargs)
-        except ClientAuthenticationError as ex:
-            LOGGER.error('Client authentication error encountered, attempting re-login and retry entity extraction.')
-            LOGGER.error(str(ex))
-            self.table_service_client = self.connect_table_service_client(account_name=self.__account_name, access_key=self.__access_key, connection_string=self.__connection_string)
-            self.table_client = self.connect_table_client(table_service_client=self.table_service_client, table_name=self.table_name)
-
-            if self.retry_entity_extraction_enabled and retries_remaining > 0:
-                LOGGER.debug(f'Retrying entity extraction {retries_remaining} more times.')
-                self.try_query_entities(query_filter=query_filter, retries_remaining=retries_remaining-1, **kwargs)
-            else:
-                LOGGER.debug('Entity extraction retry limit reached / Retry not enabled, skipping entity creation.')
\ No newline at end of file
+        if select is not None:
+            kwargs['select'] = select
+        kwargs.setdefault('results_per_page', self.max_results_per_page)
+
+        attempt = 0
+        while True:
+            try:
+                LOGGER.debug('Attempting to query entities with filter %s.', query_filter)
+                return self.table_client.query_entities(query_filter=query_filter, **kwargs)
+            except ClientAuthenticationError as ex:
+                LOGGER.error('Client authentication error encountered, retrying entity extraction with the same client.')
+                LOGGER.error(str(ex))
+
+                if not self.retry_entity_extraction_enabled or retries_remaining <= 0:
+                    LOGGER.debug('Entity extraction retry limit reached / Retry not enabled, skipping entity extraction.')
+                    return None
+
+                LOGGER.debug('Retrying entity extraction %s more times.', retries_remaining)
+                time.sleep(self.__get_retry_delay(attempt))
+                attempt += 1
+                retries_remaining -= 1
+
+    def does_row_key_exist(self, row_key: str, retries_remaining: int = 0) -> bool:
+        """
+        Checks if any entity in the table has the given row key. The result
+        is cached per table and row key, and shared across all handlers
+        until the next write to the table.
+
+        Parameters
+        ----------
+        row_key : str
+            The row key to look for.
+        retries_remaining : int, optional
+            (Default: 0) The number of retries remaining to attempt to query
+            the entities in the table.
+
+        Returns
+        -------
+        bool
+            True if at least one entity has the given row key, else False.
+        """
+
+        key = (self.table_name, row_key)
+        with TableStorageHandler.row_key_exists_cache_lock:
+            cached = TableStorageHandler.row_key_exists_cache.get(key)
+        if cached is not None:
+            LOGGER.debug('Using cached existence check for row key %s in table %s.', row_key, self.table_name)
+            return cached
+
+        # RowKey alone is not an indexed lookup without a PartitionKey, so
+        # only ask for a single result; one match is enough to decide.
+        results = self.try_query_entities(query_filter=f"RowKey eq '{row_key}'", retries_remaining=retries_remaining, select='PartitionKey', results_per_page=1)
+        has_results = results is not None and bool(next(iter(results), False))
+
+        with TableStorageHandler.row_key_exists_cache_lock:
+            TableStorageHandler.row_key_exists_cache[key] = has_results
+        return has_results
+
+    def does_entity_exist(self, partition_key: str, row_key: str, retries_remaining: int = 0) -> bool:
+        """
+        Checks if the entity with the given partition key and row key exists
+        in the table. Entities written during the current run are known to
+        exist, so only the others are looked up in the table.
+
+        Parameters
+        ----------
+        partition_key : str
+            The partition key of the entity.
+        row_key : str
+            The row key of the entity.
+        retries_remaining : int, optional
+            (Default: 0) The number of retries remaining to attempt to get
+            the entity.
+
+        Returns
+        -------
+        bool
+            True if the entity exists in the table, else False.
+        """
+
+        if (self.table_name, partition_key, row_key) in TableStorageHandler.written_entities:
+            LOGGER.debug('Entity with partition key %s and row key %s was written during this run.', partition_key, row_key)
+            return True
+
+        entity = self.try_get_entity(partition_key, row_key, select='PartitionKey', retries_remaining=retries_remaining)
+        return entity is not None
+
+    def try_query_partitions(
+            self,
+            partition_keys: Iterator[str],
+            query_filter: str = None,
+            **kwargs) -> Iterator[TableEntity]:
+        """
+        Queries the entities in the given partitions, combining the
+        partition keys into as few queries as the filter length limit
+        allows instead of sending one query per partition.
+
+        Parameters
+        ----------
+        partition_keys : collections.abc.Iterable[str]
+            The partition keys of the entities to query.
+        query_filter : str, optional
+            (Default: None) An additional filter the entities must match,
+            e.g. on the row key.
+        **kwargs
+            Additional keyword arguments to pass to `try_query_entities`.
+
+        Yields
+        ------
+        azure.data.tables.TableEntity
+            The entities in the given partitions matching the filter.
+        """
+
+        partition_keys = list(partition_keys)
+        for i in range(0, len(partition_keys), self.max_partition_keys_per_query):
+            chunk = partition_keys[i:i+self.max_partition_keys_per_query]
+            partition_filter = ' or '.join(f"PartitionKey eq '{partition_key}'" for partition_key in chunk)
+            chunk_filter = f'({partition_filter}) and {query_filter}' if query_filter is not None else partition_filter
+
+            results = self.try_query_entities(query_filter=chunk_filter, retries_remaining=self.retry_entity_extraction_count, **kwargs)
+            if results is not None:
+                yield from results
+
+    def try_query_existing_partition_keys(self, partition_keys: Iterator[str], query_filter: str = None) -> set[str]:
+        """
+        Finds which of the given partition keys have at least one entity in
+        the table matching the given filter. The partition keys are combined
+        into as few queries as the filter length limit allows.
+
+        Parameters
+        ----------
+        partition_keys : collections.abc.Iterable[str]
+            The partition keys to look for.
+        query_filter : str, optional
+            (Default: None) An additional filter the entities must match,
+            e.g. on the row key.
+
+        Returns
+        -------
+        set[str]
+            The partition keys that have matching entities in the table.
+        """
+
+        partition_keys = list(dict.fromkeys(partition_keys))
+        entities = self.try_query_partitions(partition_keys, query_filter=query_filter, select='PartitionKey')
+        existing_partition_keys = {entity['PartitionKey'] for entity in entities}
+
+        LOGGER.debug('Found %s of %s partition keys in table %s.', len(existing_partition_keys), len(partition_keys), self.table_name)
+        return existing_partition_keys
\ No newline at end of file
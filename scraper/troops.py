@@ -1,12 +1,12 @@
 import logging
 import coc
-import datetime
 
 from collections.abc import Iterator
 from scraper import CONFIG
 from scraper.coc_client import CocClientHandler
 from scraper.storage import TableStorageHandler
 from scraper.utils import try_get_attr
+from scraper.utils import get_current_date_string
 from azure.data.tables import TableEntity
 
 LOGGER = logging.getLogger(__name__)
@@ -175,15 +175,16 @@ class TroopTableHandler(CocClientHandler):
         """
 
         LOGGER.debug(f'Creating entity for {try_get_attr(data, "name")} with ID {try_get_attr(data, "id")}.')
+        season_id = get_current_date_string('%Y-%m')
         for i in range(self.__get_entity_count(data)):
-            entity = TableEntity()
+            entity = dict()
             # Mandatory keys
             # TODO: How to deal with hero pet scenario where there is no unique id?
             entity['PartitionKey'] = f'{try_get_attr(data, "id")}_{try_get_attr(data, "level", i+1, default=i+1)}'
-            entity['RowKey'] = f'{datetime.datetime.now().strftime("%Y-%m")}'
+            entity['RowKey'] = season_id
 
             # Identity keys
-            entity['SeasonId'] = datetime.datetime.now().strftime('%Y-%m')
+            entity['SeasonId'] = season_id
             entity['Id'] = try_get_attr(data, "id")
             entity['Name'] = try_get_attr(data, "name")
 
@@ -277,7 +278,7 @@ class TroopTableHandler(CocClientHandler):
 
         LOGGER.debug(f'Checking if {item} exists in table {self.table_name}.')
         
-        row_key = datetime.datetime.now().strftime('%Y-%m')
+        row_key = get_current_date_string('%Y-%m')
         is_home_village = 'true' if self.__is_item_from_home_village(item, category) else 'false'
 
         query_filter = f"RowKey eq '{row_key}' and Name eq '{item}' and IsHomeVillage eq {is_home_village}"
@@ -1,5 +1,7 @@
 import logging
+import datetime
 
+from functools import lru_cache
 from typing import Union
 from typing import Optional
 from coc.abc import BasePlayer
@@ -49,4 +51,43 @@ def try_get_attr(
             LOGGER.error(str(ex))
             return default
 
-    return out
\ No newline at end of file
+    return out
+
+@lru_cache(maxsize=16)
+def _format_date(date: datetime.date, date_format: str) -> str:
+    """
+    Formats the given date, caching the result for each date and format.
+
+    Parameters
+    ----------
+    date : datetime.date
+        The date to format.
+    date_format : str
+        The strftime format to use.
+
+    Returns
+    -------
+    str
+        The formatted date.
+    """
+
+    return date.strftime(date_format)
+
+def get_current_date_string(date_format: str = '%Y-%m-%d') -> str:
+    """
+    Returns the current local date in the given format. The formatted
+    string only changes once a day, so it is cached instead of formatting
+    the current time on every call.
+
+    Parameters
+    ----------
+    date_format : str, optional
+        (Default: '%Y-%m-%d') The strftime format to use.
+
+    Returns
+    -------
+    str
+        The current date in the given format.
+    """
+
+    return _format_date(datetime.date.today(), date_format)